@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
-from collections import namedtuple
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from email.policy import default
+import bisect
+import functools
+import threading
 import oci 
 import click
 from rich.console import Console
@@ -12,22 +16,52 @@ from typing import List
 
 console = Console()
 
+MAX_REQUESTS = 16
+# no point in running more workers than requests allowed in flight
+MAX_WORKERS = MAX_REQUESTS
+
+# caps in-flight OCI API calls across all workers to stay under the tenancy rate limit
+rate_limit = threading.BoundedSemaphore(MAX_REQUESTS)
+
+# image OCID -> operating system, image OCIDs are unique across regions so
+# the cache is shared by all collection workers
+image_os_cache = {}
+
+# OCI clients wrap a single requests session and are not thread safe, every
+# thread builds its own {(client class, region): client} cache
+thread_clients = threading.local()
+
+# long lived pool for the per-compartment attachment listings and VNIC lookups,
+# its threads keep their clients across compartments; separate from the run()
+# pool and its tasks never submit work, so a collection worker waiting on it
+# can never block its own tasks. Together with the run() pool this bounds the
+# tool to MAX_WORKERS + MAX_REQUESTS threads no matter how many compartments run
+request_pool = ThreadPoolExecutor(max_workers=MAX_REQUESTS, thread_name_prefix="oci-request")
+
+def prefix_matches(items, keys, prefix):
+    # keys are sorted lowercased names, matches are a contiguous run from bisect_left
+    for n in range(bisect.bisect_left(keys, prefix), len(keys)):
+        if not keys[n].startswith(prefix):
+            break
+        yield items[n]
+
 class CompartmentsCompleter(completion.Completer):
     
     def __init__(self, compartments: List[oci.identity.models.Compartment]) -> None:
         super().__init__()
-        self.compartments = compartments
+        self.compartments = sorted(compartments, key=lambda c: c.name.lower())
+        self.keys = [c.name.lower() for c in self.compartments]
         
     def get_completions(self, document, complete_event):
-        for c in self.compartments:
-            yield completion.Completion(c.id, 0, display=c.name)
+        word = document.get_word_before_cursor(WORD=True)
+        for c in prefix_matches(self.compartments, self.keys, word.lower()):
+            yield completion.Completion(c.id, -len(word), display=c.name)
             
 def compartments_selector(compartments):
   
   all = oci.identity.models.Compartment(name="ALL", id="ALL")
   
-  c_list = []+compartments
-  c_list.insert(0, all)
+  c_list = [all, *compartments]
   
   results = checkboxlist_dialog(
     title="Compartments",
@@ -35,7 +69,7 @@ def compartments_selector(compartments):
     values=[(c, c.name) for c in c_list]
 ).run()
   
-  if any(x.name == "ALL" for x in results):
+  if all in results:
     return compartments
   else:   
     return results
@@ -44,9 +78,7 @@ def region_selector(regions):
   
   all = oci.identity.models.RegionSubscription(region_name="ALL")
   
-  r_list = []+regions
-  r_list.sort(key=lambda x: x.region_name)
-  r_list.insert(0, all)
+  r_list = [all, *sorted(regions, key=lambda x: x.region_name)]
   
   results = checkboxlist_dialog(
     title="Regions",
@@ -54,7 +86,7 @@ def region_selector(regions):
     values=[(c, c.region_name) for c in r_list]
 ).run()
   
-  if any(x.region_name == "ALL" for x in results):
+  if all in results:
     return regions
   else: 
     return results
@@ -63,35 +95,98 @@ class InstancesCompleter(completion.Completer):
     
     def __init__(self, instances: List[oci.core.models.Instance]) -> None:
         super().__init__()
-        self.instances = instances
+        self.instances = sorted(instances, key=lambda i: i.display_name.lower())
+        self.keys = [i.display_name.lower() for i in self.instances]
         
     def get_completions(self, document, complete_event):
-        for i in self.instances:
-            yield completion.Completion(i.id, 0, display=i.display_name)
+        word = document.get_word_before_cursor(WORD=True)
+        for i in prefix_matches(self.instances, self.keys, word.lower()):
+            yield completion.Completion(i.id, -len(word), display=i.display_name)
     
+@functools.lru_cache(maxsize=8)
+def get_config(profile):
+    return oci.config.from_file(profile_name=profile)
+
+@functools.lru_cache(maxsize=8)
+def get_identity(profile):
+    return oci.identity.IdentityClient(get_config(profile), profile_name=profile)
+
+def get_client(client_cls, config):
+    if not hasattr(thread_clients, "clients"):
+        thread_clients.clients = {}
+
+    key = (client_cls, config.get('region'))
+    if key not in thread_clients.clients:
+        thread_clients.clients[key] = client_cls(config)
+
+    return thread_clients.clients[key]
+
+def rate_limited(fn):
+    # takes a rate limit slot per page request, never across a yield
+    def call(*args, **kwargs):
+        with rate_limit:
+            return fn(*args, **kwargs)
+    return call
+
+def list_all(fn, *args, **kwargs):
+    return oci.pagination.list_call_get_all_results(rate_limited(fn), *args, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY, **kwargs).data
+
+def iter_all(fn, *args, **kwargs):
+    # yields records page by page instead of materializing the whole result
+    yield from oci.pagination.list_call_get_all_results_generator(rate_limited(fn), 'record', *args, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY, **kwargs)
+
 def get_regions(identity: oci.identity.IdentityClient, config: oci.config): 
-    regions = oci.pagination.list_call_get_all_results(identity.list_region_subscriptions, config.get('tenancy'), retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY).data
+    regions = list_all(identity.list_region_subscriptions, config.get('tenancy'))
     return regions
 
 def get_instances(compute_client, compartment): 
-    instances = oci.pagination.list_call_get_all_results(compute_client.list_instances, compartment, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY).data
+    # terminated instances are never reported, drop them while paging
+    instances = [i for i in iter_all(compute_client.list_instances, compartment) if i.lifecycle_state != "TERMINATED"]
     return instances
 
-def get_compartments(profile): 
-    config = oci.config.from_file(profile_name=profile)
-    identity = oci.identity.IdentityClient(config, profile_name=profile)
+def index_attachments(config, list_method, compartment, instance_ids):
+    # runs on request_pool, so it resolves that thread's ComputeClient
+    fn = getattr(get_client(oci.core.ComputeClient, config), list_method)
+
+    idx = defaultdict(list)
+    for x in iter_all(fn, compartment):
+        if x.instance_id in instance_ids:
+            idx[x.instance_id].append(x)
+    return idx
+
+def get_vnic(vcn_client, vnic_id):
+    with rate_limit:
+        return vcn_client.get_vnic(vnic_id, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY).data
 
-    compartments = oci.pagination.list_call_get_all_results(identity.list_compartments, config.get('tenancy'), access_level='ACCESSIBLE', compartment_id_in_subtree=True, lifecycle_state='ACTIVE', retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY).data
+def get_vnics(config, vnic_ids):
+    if not vnic_ids:
+        return {}
+
+    vnics = request_pool.map(lambda vnic_id: get_vnic(get_client(oci.core.VirtualNetworkClient, config), vnic_id), vnic_ids)
+    return dict(zip(vnic_ids, vnics))
+
+def get_image_os(compute_client, image_id):
+    if image_id not in image_os_cache:
+        with rate_limit:
+            image_os_cache[image_id] = compute_client.get_image(image_id, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY).data.operating_system
+    return image_os_cache[image_id]
+
+def get_compartment(identity, compartment_id):
+    with rate_limit:
+        return identity.get_compartment(compartment_id=compartment_id).data
+
+def get_all_compartments(profile): 
+    config = get_config(profile)
+    identity = get_identity(profile)
+
+    compartments = list_all(identity.list_compartments, config.get('tenancy'), access_level='ACCESSIBLE', compartment_id_in_subtree=True, lifecycle_state='ACTIVE')
         
     return compartments
 
-def get_compartments(profile, compartment):
-    config = oci.config.from_file(profile_name=profile)
-    identity = oci.identity.IdentityClient(config, profile_name=profile)
+def get_compartments_by_ids(profile, ids):
+    config = get_config(profile)
 
-    c_list = []
-    for c in compartment.split(","):
-      c_list.append(identity.get_compartment(compartment_id=c).data)
+    c_list = list(request_pool.map(lambda c: get_compartment(get_client(oci.identity.IdentityClient, config), c), ids))
 
     return c_list
 
@@ -100,23 +195,23 @@ def get_compartments(profile, compartment):
 @click.option("--regions", "-r", "region", help="Comma separated regions to query. E.g: us-ashburn-1,us-phoenix-1")
 @click.option("--profile", "-p", help="config file profile", default='DEFAULT')
 @click.option("-b", help="batch mode", is_flag=True)
-def main(compartment, region, profile, b):
+@click.option("--workers", "-w", help=f"number of parallel collection workers, API calls are capped at {MAX_REQUESTS} in flight", default=MAX_WORKERS, show_default=True)
+def main(compartment, region, profile, b, workers):
   
     c_list = []  
     r_list = []
     
     if not compartment and not b:
-        compartments = get_compartments(profile)
+        compartments = get_all_compartments(profile)
         c_list = compartments_selector(compartments)
     elif compartment: 
-      c_list = get_compartments(profile, compartment)
+      c_list = get_compartments_by_ids(profile, compartment.split(","))
     else: 
-      compartments = get_compartments(profile)
+      compartments = get_all_compartments(profile)
       c_list = compartments
     
     if not region and not b: 
-      config = oci.config.from_file(profile_name=profile)
-      regions = get_regions(oci.identity.IdentityClient(config), config)
+      regions = get_regions(get_identity(profile), get_config(profile))
       r_list = region_selector(regions)
     
     if region: 
@@ -127,11 +222,11 @@ def main(compartment, region, profile, b):
         
     print(r_list)
         
-    run(c_list, profile, r_list)
+    run(c_list, profile, r_list, workers)
     
 def check(instance: oci.core.models.Instance, compute_client: oci.core.ComputeClient):
     
-  if "BM." in instance.shape:
+  if instance.shape.startswith("BM."):
       lm = "No - Bare Metal"
       return lm
   
@@ -153,7 +248,7 @@ def check(instance: oci.core.models.Instance, compute_client: oci.core.ComputeCl
         lm = "No (DVH)"
         return lm
     
-    if "VM.Standard.A1." in instance.shape:
+    if instance.shape.startswith("VM.Standard.A1."):
         lm = "No (ARM instance)"
         return lm
         
@@ -167,58 +262,65 @@ def check(instance: oci.core.models.Instance, compute_client: oci.core.ComputeCl
         lm = "No (GPU)"
         return lm
     
-    image = compute_client.get_image(instance.image_id, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY).data
-    if image.operating_system == "Windows":
+    # the only check that needs an API call, keep it after all attribute checks
+    if get_image_os(compute_client, instance.image_id) == "Windows":
         lm = "No (Windows)"
         return lm
 
   return lm      
 
-def collect(compute_client, vcn_client, compartment, region, instance_table): 
+def collect(config, compartment, region): 
   
+  compute_client = get_client(oci.core.ComputeClient, config)
+  rows = []
   instances = get_instances(compute_client, compartment.id)
-  vnic_attachments = oci.pagination.list_call_get_all_results(compute_client.list_vnic_attachments, compartment.id, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY).data
-  volume_attachments = oci.pagination.list_call_get_all_results(compute_client.list_volume_attachments, compartment.id, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY).data
-  
   instance_list = {}
 
+  # only attachments of running instances are reported
+  running = {i.id for i in instances if i.lifecycle_state == "RUNNING"}
+
+  vnic_idx = defaultdict(list)
+  volume_idx = defaultdict(list)
+
+  # stopped compartments need no attachments, skip both listings
+  if running:
+    f_vnic = request_pool.submit(index_attachments, config, "list_vnic_attachments", compartment.id, running)
+    f_volume = request_pool.submit(index_attachments, config, "list_volume_attachments", compartment.id, running)
+    vnic_idx, volume_idx = f_vnic.result(), f_volume.result()
+
+  vnics = get_vnics(config, [x.vnic_id for va in vnic_idx.values() for x in va])
+
   for i in instances:
-    if i.lifecycle_state == "TERMINATED": 
-      continue
-        
-    v = oci.core.models.Vnic()
     if i.lifecycle_state == "RUNNING": 
       s = ":white_check_mark:" 
-      va = [ x for x in vnic_attachments if i.id in x.instance_id ]
-      vs = []
-      bva = [ x for x in volume_attachments if i.id in x.instance_id ]
-      bv = []
+      va = vnic_idx.get(i.id, ())
+      bva = volume_idx.get(i.id, ())
+      num_volumes = str(len(bva))
+      maintenance = str(i.time_maintenance_reboot_due) if i.time_maintenance_reboot_due else None
       
       if len(va) > 0:
-        for v in va: 
-          vs.append(vcn_client.get_vnic(v.vnic_id, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY).data)
-                
-        if len(bva) > 0:
-          for a in bva: 
-            bv.append(bva) 
+        vs = [vnics[v.vnic_id] for v in va]
                      
         lm = check(i, compute_client)
         
-        instance_table.add_row(compartment.name, i.id, i.display_name, i.region, i.shape, vs[0].private_ip, vs[0].public_ip, i.lifecycle_state, i.launch_options.network_type, str(len(bva)),i.time_maintenance_reboot_due, str(lm))
+        rows.append((compartment.name, i.id, i.display_name, i.region, i.shape, vs[0].private_ip, vs[0].public_ip, i.lifecycle_state, i.launch_options.network_type, num_volumes, maintenance, lm))
         
     elif i.lifecycle_state == "STOPPED": 
         s = ":stop_sign:"
-        instance_table.add_row(i.id, i.display_name, i.shape, "", "", i.lifecycle_state, i.launch_options.network_type, "N/A","N/A", "N/A")
+        rows.append((i.id, i.display_name, i.shape, "", "", i.lifecycle_state, i.launch_options.network_type, "N/A","N/A", "N/A"))
 
     elif i.lifecycle_state == "STOPPING": 
-        instance_table.add_row(i.id, i.display_name, i.shape, "", "", i.lifecycle_state, i.launch_options.network_type, "N/A","N/A", "N/A")
+        rows.append((i.id, i.display_name, i.shape, "", "", i.lifecycle_state, i.launch_options.network_type, "N/A","N/A", "N/A"))
         s = ":stop_button:"
  
-  return instance_table
+  return rows
+
+def collect_region(config, compartment, region):
+  return collect(dict(config, region=region.region_name), compartment, region)
 
-def run(compartments, profile, r): 
-    config = oci.config.from_file(profile_name=profile)
-    identity = oci.identity.IdentityClient(config)
+def run(compartments, profile, r, max_workers=MAX_WORKERS): 
+    config = get_config(profile)
+    identity = get_identity(profile)
     
     instance_table = Table(show_header=True, header_style="bold magenta")
     instance_table.add_column("COMPARTMENT")
@@ -246,16 +348,27 @@ def run(compartments, profile, r):
       progress.update(task, total=total)
         
         
-      for region in regions: 
-          config['region'] = region.region_name
-          compute_client = oci.core.ComputeClient(config)
-          vcn_client = oci.core.VirtualNetworkClient(config)
-
-          for compartment in compartments: 
-            progress.update(task, description=f"[bold green]Collecting data | {compartment.name}  | {region.region_name} ")
-            instance_table = collect(compute_client, vcn_client, compartment, region, instance_table)
-            progress.update(task, advance=1)
+      rows = []
+      with ThreadPoolExecutor(max_workers=max_workers) as executor:
+          futures = {}
+          for region in regions: 
+              for compartment in compartments: 
+                  f = executor.submit(collect_region, config, compartment, region)
+                  futures[f] = (compartment, region)
+
+          for f in as_completed(futures):
+              compartment, region = futures[f]
+              progress.update(task, description=f"[bold green]Collecting data | {compartment.name}  | {region.region_name} ")
+              progress.update(task, advance=1)
+
+          # keep the region -> compartment order regardless of completion order
+          for f in futures:
+              rows.extend(f.result())
                       
+    # rich Table is not thread safe, fill it once collection is done
+    for row in rows:
+        instance_table.add_row(*row)
+
     console.print(instance_table)
 
 if __name__ == "__main__": 